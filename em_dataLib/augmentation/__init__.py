@@ -1,11 +1,21 @@
 # color augmentation
-from greyscale import Greyscale 
+from .greyscale import Greyscale 
 
 # transformation augmentation 
-from flip import Flip
-from warp import Warp
+# (Flip needs em_segLib, Warp the compiled warping extension)
+try:
+    from .flip import Flip
+except ImportError:
+    pass
+try:
+    from .warp import Warp
+except ImportError:
+    pass
 
 # noise augmentation
-from blur import Blur
-from missing_section import MissingSection
-from misalign import Misalign
+from .blur import Blur
+from .missing_section import MissingSection
+try:
+    from .misalign import Misalign
+except ImportError:
+    pass
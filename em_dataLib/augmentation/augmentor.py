@@ -1,9 +1,9 @@
 from collections import OrderedDict
 import numpy as np
 
-from ..options import strToArr
-
 def buildAugmentor(opt):
+    # Imported here so that DataAugment does not depend on the options module.
+    from ..options import strToArr
     aug_opt = strToArr(opt.aug_opt, '@', int)
 
     aug_param_flip = strToArr(opt.aug_param_flip, '@', float)
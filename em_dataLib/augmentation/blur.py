@@ -7,10 +7,52 @@ Kisuk Lee <kisuklee@mit.edu>, 2017
 """
 
 import numpy as np
-from scipy.ndimage.filters import gaussian_filter
+from scipy.ndimage import correlate1d
 
 from .augmentor import DataAugment
 
+def gaussian_kernel1d(sigma, truncate=4.0, dtype=np.float64):
+    """1D Gaussian weights, same as those used by scipy's gaussian_filter."""
+    radius = int(truncate * sigma + 0.5)
+    if radius == 0:
+        return np.ones(1, dtype=dtype)
+    x = np.arange(-radius, radius + 1, dtype=np.float64)
+    w = np.exp(-0.5 / (sigma * sigma) * x * x)
+    return (w / w.sum()).astype(dtype)
+
+def get_buffer(buf, shape, dtype):
+    """Return a flat buffer (grown if needed) and its `shape` view."""
+    size = int(np.prod(shape))
+    if buf is None or buf.size < size or buf.dtype != dtype:
+        buf = np.empty(size, dtype=dtype)
+    return buf, buf[:size].reshape(shape)
+
+def separable_blur(img, weights, tmp, output=None):
+    """Gaussian blur along y, then x, as two 1D correlations.
+
+    The y-pass goes into `tmp`, which must not alias `img` or `output`.
+    """
+    correlate1d(img, weights, axis=-2, output=tmp, mode='reflect')
+    return correlate1d(tmp, weights, axis=-1, output=output, mode='reflect')
+
+def fft_blur(img, weights, output=None):
+    """Same as separable_blur(), with FFT-based (overlap-add) convolutions."""
+    # Imported here: scipy.signal is slow to import and rarely needed.
+    from scipy.signal import oaconvolve
+    k = len(weights)
+    r = k // 2
+    # 'symmetric' padding is ndimage's 'reflect' boundary mode.
+    pad = [(0,0)]*(img.ndim - 2) + [(r,r), (r,r)]
+    ret = np.pad(img, pad, mode='symmetric')
+    shape = [1]*img.ndim
+    ret = oaconvolve(ret, weights.reshape(shape[:-2] + [k,1]), mode='valid', axes=-2)
+    ret = oaconvolve(ret, weights.reshape(shape[:-2] + [1,k]), mode='valid', axes=-1)
+    if output is None:
+        return ret.astype(img.dtype, copy=False)
+    output[...] = ret
+    return output
+
+
 class Blur(DataAugment):
     """
     Introduce out-of-focus section(s) to a training example.
@@ -19,9 +61,13 @@ class Blur(DataAugment):
     uniform distribution between [0, MAX_SEC]. Default MAX_SEC is 1, which can
     be overwritten by user-specified value. Out-of-focus process is implemented
     with Gaussian blurring.
+
+    Volumes are blurred in their own dtype; float32 input moves half the
+    bytes of float64 (ndimage still accumulates in double).
     """
 
-    def __init__(self, max_sec=1, sigma_max=5.0, mode='full', skip_ratio=0.3):
+    def __init__(self, max_sec=1, sigma_max=5.0, mode='full', skip_ratio=0.3,
+                 seed=None):
         """Initialize parameters.
 
         Args:
@@ -29,15 +75,28 @@ class Blur(DataAugment):
             sigma_max: Maximum width for Gaussian blur filter.
             mode: 'full', 'partial', 'mix'
             skip_ratio: Probability of skipping augmentation.
+            seed: Seed for the random number generator (see set_seed).
         """
+        self.set_seed(seed)
         self.set_max_sections(max_sec)
         self.set_sigma_max(sigma_max)
         self.set_mode(mode)
         self.set_skip_ratio(skip_ratio)
+        # Below this sigma the Gaussian taps are nearly an identity filter.
+        self.MIN_SIGMA = 0.3
+        # Above this kernel size FFT-based convolution is faster.
+        self.FFT_KSIZE = 41
+        # 1D Gaussian weights, keyed by sigma rounded to 0.1.
+        self._kernels = dict()
+        # Scratch buffers for the y-pass and for partial blurs, grown to the
+        # largest slice seen and reused across calls.
+        self._scratch = None
+        self._scratch_out = None
+        self._mask = None
 
     def prepare(self, spec, **kwargs):
         # No change in spec.
-        self.skip = np.random.rand() < self.skip_ratio
+        self.skip = self.rng.random() < self.skip_ratio
         return spec
 
     def __call__(self, sample, **kwargs):
@@ -48,7 +107,7 @@ class Blur(DataAugment):
     def augment(self, sample, **kwargs):
         """Apply out-of-section section data augmentation."""
         # Randomly draw the number of sections to introduce.
-        num_sec = np.random.randint(1, self.MAX_SEC + 1)
+        num_sec = self.rng.integers(1, self.MAX_SEC + 1)
 
         # DEBUG(kisuk)
         # print "\n[Blur]"
@@ -57,63 +116,119 @@ class Blur(DataAugment):
         # Assume that the sample contains only one input volume, or multiple
         # input volumes of same size.
         imgs = kwargs['imgs']
-        dims = set([])
-        for key in imgs:
-            dim = sample[key].shape[-3:]
-            assert num_sec < dim[-3]
-            dims.add(dim)
-        assert len(dims) == 1
-        dim  = dims.pop()
+        if __debug__:
+            # Consistency check only; stripped under python -O.
+            dims = set([sample[key].shape[-3:] for key in imgs])
+            assert len(dims) == 1
+        dim  = sample[next(iter(imgs))].shape[-3:]
+        assert num_sec < dim[-3]
         xdim = dim[-1]
         ydim = dim[-2]
         zdim = dim[-3]
 
         # Randomly draw z-slices to blur.
-        zlocs = sorted(np.random.choice(zdim, num_sec, replace=False))
+        zlocs = np.sort(self.rng.choice(zdim, num_sec, replace=False)).tolist()
 
         # Apply full or partial missing sections according to the mode.
         if self.mode == 'full':
-            for z in zlocs:
-                for key in imgs:
-                    sigma = np.random.rand() * self.sigma_max
-                    img = sample[key][...,z,:,:]
-                    sample[key][...,z,:,:] = gaussian_filter(img, sigma=sigma)
+            sigmas = self.rng.random((num_sec, len(imgs))) * self.sigma_max
+            for i, z in enumerate(zlocs):
+                for j, key in enumerate(imgs):
+                    sigma = sigmas[i,j]
+                    if sigma < self.MIN_SIGMA:
+                        continue
+                    self.blur_slice(sample[key][...,z,:,:], self.get_kernel(sigma))
                     # DEBUG(kisuk)
                     # print 'z = {}, sigma = {}'.format(z+1,sigma)
         else:
-            for z in zlocs:
-                # Random sigma.
-                sigma = np.random.rand() * self.sigma_max
+            # Random sigma per section and, per section and key, full/partial
+            # choice, xy-coordinate and quadrants.
+            sigmas = self.rng.random(num_sec) * self.sigma_max
+            fulls  = self.rng.random((num_sec, len(imgs))) > 0.5
+            xs     = self.rng.integers(0, xdim, (num_sec, len(imgs)))
+            ys     = self.rng.integers(0, ydim, (num_sec, len(imgs)))
+            rules  = self.rng.random((num_sec, len(imgs), 4)) > 0.5
+            for i, z in enumerate(zlocs):
+                sigma = sigmas[i]
+                if sigma < self.MIN_SIGMA:
+                    continue
+                weights = self.get_kernel(sigma)
+                radius = len(weights) // 2
                 # DEBUG(kisuk)
                 # print 'z = {}, sigma = {}'.format(z+1,sigma)
                 # Blurring.
-                for key in imgs:
+                for j, key in enumerate(imgs):
                     img = sample[key][...,z,:,:]
-                    img = gaussian_filter(img, sigma=sigma)
                     # Full or partial?
-                    if self.mode == 'mix' and np.random.rand() > 0.5:
+                    if self.mode == 'mix' and fulls[i,j]:
                         # Full image blurring.
-                        sample[key][...,z,:,:] = img
-                    else:
-                        # Draw a random xy-coordinate.
-                        x = np.random.randint(0, xdim)
-                        y = np.random.randint(0, ydim)
-                        rule = np.random.rand(4) > 0.5
-                        # 1st quadrant.
-                        if rule[0]:
-                            sample[key][...,z,:y,:x] = img[...,:y,:x]
-                        # 2nd quadrant.
-                        if rule[1]:
-                            sample[key][...,z,y:,:x] = img[...,y:,:x]
-                        # 3nd quadrant.
-                        if rule[2]:
-                            sample[key][...,z,:y,x:] = img[...,:y,x:]
-                        # 4nd quadrant.
-                        if rule[3]:
-                            sample[key][...,z,y:,x:] = img[...,y:,x:]
+                        self.blur_slice(img, weights)
+                        continue
+                    # Random xy-coordinate.
+                    x = int(xs[i,j])
+                    y = int(ys[i,j])
+                    rule = rules[i,j]
+                    if not rule.any():
+                        continue
+                    # Bounding box of the selected quadrants.
+                    y0 = 0 if rule[0] or rule[2] else y
+                    y1 = ydim if rule[1] or rule[3] else y
+                    x0 = 0 if rule[0] or rule[1] else x
+                    x1 = xdim if rule[2] or rule[3] else x
+                    # Only blur the bounding box, padded by the kernel radius
+                    # so that the result inside the box is unchanged.
+                    cy = max(y0 - radius, 0)
+                    cx = max(x0 - radius, 0)
+                    crop = img[...,cy:min(y1 + radius, ydim),
+                                   cx:min(x1 + radius, xdim)]
+                    tmp, out = self.get_scratch(crop.shape, crop.dtype, 2)
+                    blurred = self.blur(crop, weights, tmp, output=out)
+                    # Single masked write of the selected quadrants.
+                    self._mask, mask = get_buffer(self._mask, (y1-y0, x1-x0), bool)
+                    mask[...] = False
+                    # 1st quadrant.
+                    if rule[0]:
+                        mask[:y-y0,:x-x0] = True
+                    # 2nd quadrant.
+                    if rule[1]:
+                        mask[y-y0:,:x-x0] = True
+                    # 3nd quadrant.
+                    if rule[2]:
+                        mask[:y-y0,x-x0:] = True
+                    # 4nd quadrant.
+                    if rule[3]:
+                        mask[y-y0:,x-x0:] = True
+                    np.copyto(img[...,y0:y1,x0:x1],
+                              blurred[...,y0-cy:y1-cy,x0-cx:x1-cx], where=mask)
 
         return sample
 
+    def get_kernel(self, sigma):
+        """Return (cached) 1D Gaussian weights for sigma, rounded to 0.1."""
+        sigma = round(sigma, 1)
+        if sigma not in self._kernels:
+            self._kernels[sigma] = gaussian_kernel1d(sigma)
+        return self._kernels[sigma]
+
+    def blur(self, img, weights, tmp, output=None):
+        """Direct or FFT-based Gaussian blur, depending on the kernel size."""
+        if len(weights) > self.FFT_KSIZE:
+            return fft_blur(img, weights, output=output)
+        return separable_blur(img, weights, tmp, output=output)
+
+    def get_scratch(self, shape, dtype, n=1):
+        """Return `n` scratch arrays of given shape, reusing the buffers."""
+        self._scratch, tmp = get_buffer(self._scratch, shape, dtype)
+        if n == 1:
+            return tmp
+        self._scratch_out, out = get_buffer(self._scratch_out, shape, dtype)
+        return tmp, out
+
+    def blur_slice(self, img, weights):
+        """Blur a (y,x) slice view in place."""
+        tmp = self.get_scratch(img.shape, img.dtype)
+        self.blur(img, weights, tmp, output=img)
+
     ####################################################################
     ## Setters.
     ####################################################################
@@ -128,6 +243,16 @@ class Blur(DataAugment):
         assert ratio >= 0.0 and ratio <= 1.0
         self.skip_ratio = ratio
 
+    def set_seed(self, seed):
+        """(Re)seed the random number generator of this augmentation.
+
+        The generator is per instance, so np.random.seed() does not reach
+        it, and forked DataLoader workers inherit identical states. Call
+        this from each worker (e.g. in worker_init_fn) with a distinct
+        seed. A np.random.Generator may also be passed and is used as is.
+        """
+        self.rng = np.random.default_rng(seed)
+
     def set_mode(self, mode):
         """Set full/partial/mix missing section mode."""
         assert mode=='full' or mode=='partial' or mode=='mix'
@@ -16,6 +16,8 @@ class Flip(DataAugment):
         self.mode = param[0]
         if self.mode != -1:
             self.aug_rot = [int(x) for x in '{0:04b}'.format(self.mode)]
+            self.aug_any = max(self.aug_rot) == 1
+            self.aug_pad = max(self.aug_rot[:3]) == 1
         
         self.aug_rot_st = np.ones((3,3), dtype=int)
         spec['rot_pad'] = np.zeros(3, dtype=int)
@@ -34,7 +36,9 @@ class Flip(DataAugment):
         # before data sample
         if self.mode == -1: # random
             # rules
-            self.aug_rot = ''.join([str(int(x>0.5)) for x in np.random.random(4)])
+            self.aug_rot = [int(x>0.5) for x in np.random.random(4)]
+            self.aug_any = max(self.aug_rot) == 1
+            self.aug_pad = max(self.aug_rot[:3]) == 1
             # for sampler to sample volume
             spec['rot_pad'] = np.array(self.aug_rot[:3])
             # for augmentor to flip/crop volume
@@ -44,6 +48,8 @@ class Flip(DataAugment):
 
     def __call__(self, sample):
         # after data sample
-        for k, v in sample.iteritems():
-            sample[k] = flip(v, self.aug_rot, k, max(self.aug_rot[:3])==1, self.aug_rot_st)
+        if not self.aug_any: # identity: no flip, swap or padding to crop
+            return sample
+        for k, v in sample.items():
+            sample[k] = flip(v, self.aug_rot, k, self.aug_pad, self.aug_rot_st)
         return sample
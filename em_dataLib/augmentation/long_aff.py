@@ -10,20 +10,33 @@ import numpy as np
 
 from .augmentor import DataAugment
 
+def adjust(arr, c, b, g):
+    """In-place arr = clip(arr*c + b, 0, 1)**g, without temporaries."""
+    arr *= c
+    arr += b
+    np.clip(arr, 0, 1, out=arr)
+    arr **= g
+    return arr
+
 class LongAff(DataAugment):
     """
     Greyscale value augmentation.
 
     Randomly adjust contrast/brightness, and apply random gamma correction.
+
+    Volumes are adjusted in their own dtype (random parameters are drawn to
+    match), so float32 input is about twice as fast as float64.
     """
 
-    def __init__(self, mode='mix', skip_ratio=0.3):
+    def __init__(self, mode='mix', skip_ratio=0.3, seed=None):
         """Initialize parameters.
 
         Args:
             mode: '2D', '3D', 'mix'
             skip_ratio: Probability of skipping augmentation.
+            seed: Seed for the random number generator (see set_seed).
         """
+        self.set_seed(seed)
         self.set_mode(mode)
         self.set_skip_ratio(skip_ratio)
         self.CONTRAST_FACTOR   = 0.3
@@ -31,13 +44,13 @@ class LongAff(DataAugment):
 
     def prepare(self, spec, **kwargs):
         # No change in sample spec.
-        self.skip = np.random.rand() < self.skip_ratio
+        self.skip = self.rng.random() < self.skip_ratio
         return spec
 
     def __call__(self, sample, **kwargs):
         if not self.skip:
             if self.mode == 'mix':
-                mode = '3D' if np.random.rand() > 0.5 else '2D'
+                mode = '3D' if self.rng.random() > 0.5 else '2D'
             else:
                 mode = self.mode
             if mode is '2D': self.augment2D(sample, **kwargs)
@@ -50,13 +63,15 @@ class LongAff(DataAugment):
         """
         imgs = kwargs['imgs']
         for key in imgs:
-            for z in xrange(sample[key].shape[-3]):
-                img = sample[key][...,z,:,:]
-                img *= 1 + (np.random.rand() - 0.5)*self.CONTRAST_FACTOR
-                img += (np.random.rand() - 0.5)*self.BRIGHTNESS_FACTOR
-                img = np.clip(img, 0, 1)
-                img **= 2.0**(np.random.rand()*2 - 1)
-                sample[key][...,z,:,:] = img
+            # Random per-slice parameters, broadcast over (y,x). They are in
+            # the volume's float dtype so float32 math stays in float32.
+            zdim = sample[key].shape[-3]
+            dtype = np.result_type(sample[key].dtype, np.float32)
+            r = self.rng.random((3,zdim,1,1)).astype(dtype)
+            c = 1 + (r[0] - 0.5)*self.CONTRAST_FACTOR
+            b = (r[1] - 0.5)*self.BRIGHTNESS_FACTOR
+            g = 2.0**(r[2]*2 - 1)
+            adjust(sample[key], c, b, g)
         return sample
 
     def augment3D(self, sample, **kwargs):
@@ -65,10 +80,12 @@ class LongAff(DataAugment):
         """
         imgs = kwargs['imgs']
         for key in imgs:
-            sample[key] *= 1 + (np.random.rand() - 0.5)*self.CONTRAST_FACTOR
-            sample[key] += (np.random.rand() - 0.5)*self.BRIGHTNESS_FACTOR
-            sample[key] = np.clip(sample[key], 0, 1)
-            sample[key] **= 2.0**(np.random.rand()*2 - 1)
+            # Python floats, so float32 math stays in float32.
+            r = self.rng.random(3).tolist()
+            c = 1 + (r[0] - 0.5)*self.CONTRAST_FACTOR
+            b = (r[1] - 0.5)*self.BRIGHTNESS_FACTOR
+            g = 2.0**(r[2]*2 - 1)
+            adjust(sample[key], c, b, g)
         return sample
 
     ####################################################################
@@ -84,3 +101,10 @@ class LongAff(DataAugment):
         """Set the probability of skipping augmentation."""
         assert ratio >= 0.0 and ratio <= 1.0
         self.skip_ratio = ratio
+
+    def set_seed(self, seed):
+        """Reseed the per-instance generator (a seed or a np.random.Generator).
+
+        Call once per DataLoader worker, as Blur.set_seed().
+        """
+        self.rng = np.random.default_rng(seed)
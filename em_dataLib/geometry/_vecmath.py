@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+__doc__ = """
+Component-wise vector math kernels for Vec3dArray.
+
+Each kernel takes the x, y, z components of its operands as separate
+arguments (arrays or scalars). If numba is installed, a kernel is
+JIT-compiled on its first call, so it runs as a single fused loop
+without temporaries; otherwise it is evaluated with plain numpy.
+"""
+
+import functools
+
+def lazy_jit(f):
+    """Compile f with numba on the first call; keep f if numba is missing.
+
+    numba is imported here rather than at module load, so importing the
+    geometry package stays cheap. The compiled code is not cached on disk,
+    because numba's cache is keyed by source path and this package is
+    imported under more than one module name. Argument types numba cannot
+    compile (e.g. float16 or object arrays) fall back to f.
+    """
+    impl = []
+    @functools.wraps(f)
+    def wrapper(*args):
+        if not impl:
+            try:
+                import numba
+                from numba.core.errors import NumbaError
+                impl.append((numba.njit(fastmath=True)(f),
+                             (NumbaError, NotImplementedError)))
+            except ImportError:
+                impl.append((f, ()))
+        jitted, errors = impl[0]
+        try:
+            return jitted(*args)
+        except errors:
+            return f(*args)
+    return wrapper
+
+@lazy_jit
+def dot3(ax, ay, az, bx, by, bz):
+    return ax*bx + ay*by + az*bz
+
+@lazy_jit
+def cross3(ax, ay, az, bx, by, bz):
+    return (ay*bz - az*by,
+            az*bx - ax*bz,
+            ax*by - ay*bx)
+
+@lazy_jit
+def lerp3(ax, ay, az, bx, by, bz, t):
+    return (ax + (bx - ax)*t,
+            ay + (by - ay)*t,
+            az + (bz - az)*t)
@@ -9,6 +9,13 @@ Kisuk Lee <kisuklee@mit.edu>, 2015-2016
 import math
 import operator
 
+import numpy as np
+
+try:
+    from . import _vecmath
+except (ImportError, ValueError): # imported as a top-level module
+    import _vecmath
+
 class Vec3d(object):
     """
     3d vector class, supports vector and scalar operators,
@@ -50,6 +57,11 @@ class Vec3d(object):
         else:
             raise IndexError("Invalid subscript "+str(key)+" to Vec3d")
 
+    # NumPy interoperability
+    def __array__(self, dtype=None, copy=None):
+        """Convert to a length-3 ndarray, e.g. np.asarray(v)."""
+        return np.array((self.x, self.y, self.z), dtype=dtype)
+
     # String representaion (for debugging)
     def __repr__(self):
         return 'Vec3d(%s, %s, %s)' % (self.x, self.y, self.z)
@@ -77,7 +89,7 @@ class Vec3d(object):
             return Vec3d(f(self.x, v.x),
                          f(self.y, v.y),
                          f(self.z, v.z))
-        elif (hasattr(v, "__getitem__")):
+        elif hasattr(v, "__getitem__") and not isinstance(v, np.generic):
             return Vec3d(f(self.x, v[0]),
                          f(self.y, v[1]),
                          f(self.z, v[2]))
@@ -88,7 +100,7 @@ class Vec3d(object):
 
     def _r_o2(self, v, f):
         "Any two-operator operation where the right operand is a Vec3d"
-        if (hasattr(v, "__getitem__")):
+        if hasattr(v, "__getitem__") and not isinstance(v, np.generic):
             return Vec3d(f(v[0], self.x),
                          f(v[1], self.y),
                          f(v[2], self.z))
@@ -99,7 +111,7 @@ class Vec3d(object):
 
     def _io(self, v, f):
         "inplace operator"
-        if (hasattr(v, "__getitem__")):
+        if hasattr(v, "__getitem__") and not isinstance(v, np.generic):
             self.x = f(self.x, v[0])
             self.y = f(self.y, v[1])
             self.z = f(self.z, v[2])
@@ -109,107 +121,236 @@ class Vec3d(object):
             self.z = f(self.z, v)
         return self
 
+    # Arithmetic operators are specialized on the operand type; the generic
+    # handlers above are kept for the rarely used ones.
+
     # Addition
     def __add__(self, v):
-        if isinstance(v, Vec3d):
+        t = type(v)
+        if t is Vec3d:
             return Vec3d(self.x + v.x, self.y + v.y, self.z + v.z)
-        elif hasattr(v, "__getitem__"):
+        elif t is float or t is int:
+            return Vec3d(self.x + v, self.y + v, self.z + v)
+        elif t is tuple or t is list:
             return Vec3d(self.x + v[0], self.y + v[1], self.z + v[2])
-        else:
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
             return Vec3d(self.x + v, self.y + v, self.z + v)
+        else:
+            return Vec3d(self.x + v[0], self.y + v[1], self.z + v[2])
     __radd__ = __add__
 
     def __iadd__(self, v):
-        if isinstance(v, Vec3d):
+        t = type(v)
+        if t is Vec3d:
             self.x += v.x
             self.y += v.y
             self.z += v.z
-        elif hasattr(v, "__getitem__"):
+        elif t is float or t is int:
+            self.x += v
+            self.y += v
+            self.z += v
+        elif t is tuple or t is list:
             self.x += v[0]
             self.y += v[1]
             self.z += v[2]
-        else:
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
             self.x += v
             self.y += v
             self.z += v
+        else:
+            self.x += v[0]
+            self.y += v[1]
+            self.z += v[2]
         return self
 
     # Subtraction
     def __sub__(self, v):
-        if isinstance(v, Vec3d):
+        t = type(v)
+        if t is Vec3d:
             return Vec3d(self.x - v.x, self.y - v.y, self.z - v.z)
-        elif (hasattr(v, "__getitem__")):
+        elif t is float or t is int:
+            return Vec3d(self.x - v, self.y - v, self.z - v)
+        elif t is tuple or t is list:
             return Vec3d(self.x - v[0], self.y - v[1], self.z - v[2])
-        else:
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
             return Vec3d(self.x - v, self.y - v, self.z - v)
+        else:
+            return Vec3d(self.x - v[0], self.y - v[1], self.z - v[2])
     def __rsub__(self, v):
-        if isinstance(v, Vec3d):
+        t = type(v)
+        if t is Vec3d:
             return Vec3d(v.x - self.x, v.y - self.y, v.z - self.z)
-        if (hasattr(v, "__getitem__")):
+        elif t is float or t is int:
+            return Vec3d(v - self.x, v - self.y, v - self.z)
+        elif t is tuple or t is list:
             return Vec3d(v[0] - self.x, v[1] - self.y, v[2] - self.z)
-        else:
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
             return Vec3d(v - self.x, v - self.y, v - self.z)
+        else:
+            return Vec3d(v[0] - self.x, v[1] - self.y, v[2] - self.z)
     def __isub__(self, v):
-        if isinstance(v, Vec3d):
+        t = type(v)
+        if t is Vec3d:
             self.x -= v.x
             self.y -= v.y
             self.z -= v.z
-        elif (hasattr(v, "__getitem__")):
+        elif t is float or t is int:
+            self.x -= v
+            self.y -= v
+            self.z -= v
+        elif t is tuple or t is list:
             self.x -= v[0]
             self.y -= v[1]
             self.z -= v[2]
-        else:
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
             self.x -= v
             self.y -= v
             self.z -= v
+        else:
+            self.x -= v[0]
+            self.y -= v[1]
+            self.z -= v[2]
         return self
 
     # Multiplication
     def __mul__(self, v):
-        if isinstance(v, Vec3d):
+        t = type(v)
+        if t is Vec3d:
             return Vec3d(self.x*v.x, self.y*v.y, self.z*v.z)
-        if (hasattr(v, "__getitem__")):
+        elif t is float or t is int:
+            return Vec3d(self.x*v, self.y*v, self.z*v)
+        elif t is tuple or t is list:
             return Vec3d(self.x*v[0], self.y*v[1], self.z*v[2])
-        else:
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
             return Vec3d(self.x*v, self.y*v, self.z*v)
+        else:
+            return Vec3d(self.x*v[0], self.y*v[1], self.z*v[2])
     __rmul__ = __mul__
 
     def __imul__(self, v):
-        if isinstance(v, Vec3d):
+        t = type(v)
+        if t is Vec3d:
             self.x *= v.x
             self.y *= v.y
             self.z *= v.z
-        elif (hasattr(v, "__getitem__")):
+        elif t is float or t is int:
+            self.x *= v
+            self.y *= v
+            self.z *= v
+        elif t is tuple or t is list:
             self.x *= v[0]
             self.y *= v[1]
             self.z *= v[2]
-        else:
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
             self.x *= v
             self.y *= v
             self.z *= v
+        else:
+            self.x *= v[0]
+            self.y *= v[1]
+            self.z *= v[2]
         return self
 
     # Division
-    def __div__(self, v):
-        return self._o2(v, operator.div)
-    def __rdiv__(self, v):
-        return self._r_o2(v, operator.div)
-    def __idiv__(self, v):
-        return self._io(v, operator.div)
+    def __truediv__(self, v):
+        t = type(v)
+        if t is Vec3d:
+            return Vec3d(self.x / v.x, self.y / v.y, self.z / v.z)
+        elif t is float or t is int:
+            return Vec3d(self.x / v, self.y / v, self.z / v)
+        elif t is tuple or t is list:
+            return Vec3d(self.x / v[0], self.y / v[1], self.z / v[2])
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
+            return Vec3d(self.x / v, self.y / v, self.z / v)
+        else:
+            return Vec3d(self.x / v[0], self.y / v[1], self.z / v[2])
+    def __rtruediv__(self, v):
+        t = type(v)
+        if t is Vec3d:
+            return Vec3d(v.x / self.x, v.y / self.y, v.z / self.z)
+        elif t is float or t is int:
+            return Vec3d(v / self.x, v / self.y, v / self.z)
+        elif t is tuple or t is list:
+            return Vec3d(v[0] / self.x, v[1] / self.y, v[2] / self.z)
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
+            return Vec3d(v / self.x, v / self.y, v / self.z)
+        else:
+            return Vec3d(v[0] / self.x, v[1] / self.y, v[2] / self.z)
+    def __itruediv__(self, v):
+        t = type(v)
+        if t is Vec3d:
+            self.x /= v.x
+            self.y /= v.y
+            self.z /= v.z
+        elif t is float or t is int:
+            self.x /= v
+            self.y /= v
+            self.z /= v
+        elif t is tuple or t is list:
+            self.x /= v[0]
+            self.y /= v[1]
+            self.z /= v[2]
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
+            self.x /= v
+            self.y /= v
+            self.z /= v
+        else:
+            self.x /= v[0]
+            self.y /= v[1]
+            self.z /= v[2]
+        return self
+    # Python 2 classic division.
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+    __idiv__ = __itruediv__
 
     def __floordiv__(self, v):
-        return self._o2(v, operator.floordiv)
+        t = type(v)
+        if t is Vec3d:
+            return Vec3d(self.x // v.x, self.y // v.y, self.z // v.z)
+        elif t is float or t is int:
+            return Vec3d(self.x // v, self.y // v, self.z // v)
+        elif t is tuple or t is list:
+            return Vec3d(self.x // v[0], self.y // v[1], self.z // v[2])
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
+            return Vec3d(self.x // v, self.y // v, self.z // v)
+        else:
+            return Vec3d(self.x // v[0], self.y // v[1], self.z // v[2])
     def __rfloordiv__(self, v):
-        return self._r_o2(v, operator.floordiv)
+        t = type(v)
+        if t is Vec3d:
+            return Vec3d(v.x // self.x, v.y // self.y, v.z // self.z)
+        elif t is float or t is int:
+            return Vec3d(v // self.x, v // self.y, v // self.z)
+        elif t is tuple or t is list:
+            return Vec3d(v[0] // self.x, v[1] // self.y, v[2] // self.z)
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
+            return Vec3d(v // self.x, v // self.y, v // self.z)
+        else:
+            return Vec3d(v[0] // self.x, v[1] // self.y, v[2] // self.z)
     def __ifloordiv__(self, v):
-        return self._io(v, operator.floordiv)
-
-    def __truediv__(self, v):
-        return self._o2(v, operator.truediv)
-    def __rtruediv__(self, v):
-        return self._r_o2(v, operator.truediv)
-    def __itruediv__(self, v):
-        return self._io(v, operator.floordiv)
+        t = type(v)
+        if t is Vec3d:
+            self.x //= v.x
+            self.y //= v.y
+            self.z //= v.z
+        elif t is float or t is int:
+            self.x //= v
+            self.y //= v
+            self.z //= v
+        elif t is tuple or t is list:
+            self.x //= v[0]
+            self.y //= v[1]
+            self.z //= v[2]
+        elif isinstance(v, np.generic) or not hasattr(v, "__getitem__"):
+            self.x //= v
+            self.y //= v
+            self.z //= v
+        else:
+            self.x //= v[0]
+            self.y //= v[1]
+            self.z //= v[2]
+        return self
 
     # Modulo
     def __mod__(self, v):
@@ -270,42 +411,45 @@ class Vec3d(object):
 
     # vectory functions
     def get_length_sqrd(self):
-        return self.x**2 + self.y**2 + self.z**2
+        return self.x*self.x + self.y*self.y + self.z*self.z
 
     def get_length(self):
-        return math.sqrt(self.x**2 + self.y**2 + self.z**2)
+        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
     def __setlength(self, value):
-        length = self.get_length()
-        self.x *= value/length
-        self.y *= value/length
-        self.z *= value/length
+        inv = value/self.get_length()
+        self.x *= inv
+        self.y *= inv
+        self.z *= inv
     length = property(get_length, __setlength, None,
                       "gets or sets the magnitude of the vector")
 
     def normalized(self):
         length = self.length
         if length != 0:
-            return self/length
+            inv = 1.0/length
+            return Vec3d(self.x*inv, self.y*inv, self.z*inv)
         return Vec3d(self)
 
     def normalize_return_length(self):
         length = self.length
         if length != 0:
-            self.x /= length
-            self.y /= length
-            self.z /= length
+            inv = 1.0/length
+            self.x *= inv
+            self.y *= inv
+            self.z *= inv
         return length
 
     def dot(self, v):
         return float(self.x*v[0] + self.y*v[1] + self.z*v[2])
 
     def get_distance(self, v):
-        return math.sqrt((self.x - v[0])**2 +
-                         (self.y - v[1])**2 +
-                         (self.z - v[2])**2)
+        return math.sqrt(self.get_dist_sqrd(v))
 
     def get_dist_sqrd(self, v):
-        return (self.x - v[0])**2 + (self.y - v[1])**2 + (self.z - v[2])**2
+        dx = self.x - v[0]
+        dy = self.y - v[1]
+        dz = self.z - v[2]
+        return dx*dx + dy*dy + dz*dz
 
     def projection(self, v):
         v_length_sqrd = v[0]*v[0] + v[1]*v[1] + v[2]*v[2]
@@ -328,16 +472,134 @@ class Vec3d(object):
                      self.dot(z_vector)/z_vector.get_length_sqrd())
 
     def __getstate__(self):
-        return [self.x, self.y, self.z]
+        return (self.x, self.y, self.z)
 
     def __setstate__(self, dict):
         self.x, self.y, self.z = dict
 
+    def __reduce_ex__(self, protocol):
+        # Rebuild directly from the components, skipping the state round-trip.
+        return (type(self), (self.x, self.y, self.z))
+
+
+class Vec3dArray(object):
+    """
+    Batch of 3d vectors, stored as three contiguous component arrays
+    (structure of arrays), with vectorized versions of the Vec3d functions.
+    """
+    __slots__ = ['x', 'y', 'z']
+
+    def __init__(self, x_or_vectors, y = None, z = None):
+        if y is None:
+            # (N,3) array-like, e.g. a list of Vec3d.
+            a = np.asarray(x_or_vectors)
+            x_or_vectors, y, z = a[...,0], a[...,1], a[...,2]
+        self.x = np.ascontiguousarray(x_or_vectors)
+        self.y = np.ascontiguousarray(y)
+        self.z = np.ascontiguousarray(z)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return Vec3d(self.x[key], self.y[key], self.z[key])
+        return Vec3dArray(self.x[key], self.y[key], self.z[key])
+
+    def __array__(self, dtype=None, copy=None):
+        """Convert to an (N,3) ndarray."""
+        a = np.stack((self.x, self.y, self.z), axis=-1)
+        return a if dtype is None else a.astype(dtype, copy=False)
+
+    def __repr__(self):
+        return 'Vec3dArray(%s, %s, %s)' % (self.x, self.y, self.z)
+
+    def _components(self, v):
+        "Components of another Vec3dArray, a single vector, or a scalar"
+        if isinstance(v, Vec3dArray):
+            return v.x, v.y, v.z
+        elif isinstance(v, (Vec3d, tuple, list)):
+            return v[0], v[1], v[2]
+        else:
+            # Numbers, numpy scalars and per-vector ndarrays broadcast.
+            return v, v, v
+
+    def __add__(self, v):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(self.x + vx, self.y + vy, self.z + vz)
+    __radd__ = __add__
+
+    def __sub__(self, v):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(self.x - vx, self.y - vy, self.z - vz)
+
+    def __rsub__(self, v):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(vx - self.x, vy - self.y, vz - self.z)
+
+    def __mul__(self, v):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(self.x*vx, self.y*vy, self.z*vz)
+    __rmul__ = __mul__
+
+    def __truediv__(self, v):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(self.x/vx, self.y/vy, self.z/vz)
+    __div__ = __truediv__
+
+    def __neg__(self):
+        return Vec3dArray(-self.x, -self.y, -self.z)
+
+    # vectory functions
+    def get_length_sqrd(self):
+        return self.x*self.x + self.y*self.y + self.z*self.z
+
+    def get_length(self):
+        return np.sqrt(self.get_length_sqrd())
+    length = property(get_length, None, None,
+                      "gets the magnitudes of the vectors")
+
+    def normalized(self):
+        length = self.get_length()
+        # Zero-length vectors are left as is, like Vec3d.normalized().
+        inv = 1.0/np.where(length != 0, length, 1)
+        return Vec3dArray(self.x*inv, self.y*inv, self.z*inv)
+
+    def dot(self, v):
+        vx, vy, vz = self._components(v)
+        return _vecmath.dot3(self.x, self.y, self.z, vx, vy, vz)
+
+    def cross(self, v):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(*_vecmath.cross3(self.x, self.y, self.z, vx, vy, vz))
+
+    def interpolate_to(self, v, range):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(*_vecmath.lerp3(self.x, self.y, self.z,
+                                          vx, vy, vz, range))
+
+    def minimum(self, v):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(np.minimum(self.x, vx),
+                          np.minimum(self.y, vy),
+                          np.minimum(self.z, vz))
+
+    def maximum(self, v):
+        vx, vy, vz = self._components(v)
+        return Vec3dArray(np.maximum(self.x, vx),
+                          np.maximum(self.y, vy),
+                          np.maximum(self.z, vz))
+
 
 ########################################################################
 ## Helper vector functions
 ########################################################################
 def minimum(v1, v2):
+    if isinstance(v1, Vec3dArray):
+        return v1.minimum(v2)
+    if isinstance(v2, Vec3dArray):
+        return v2.minimum(v1)
+
     v1 = Vec3d(v1)
     v2 = Vec3d(v2)
 
@@ -349,6 +611,11 @@ def minimum(v1, v2):
 
 
 def maximum(v1, v2):
+    if isinstance(v1, Vec3dArray):
+        return v1.maximum(v2)
+    if isinstance(v2, Vec3dArray):
+        return v2.maximum(v1)
+
     v1 = Vec3d(v1)
     v2 = Vec3d(v2)
 
@@ -1,7 +1,7 @@
-import h5py
 import numpy as np
+from scipy.ndimage import gaussian_filter
 
-from em_data.augmentation import *
+from em_dataLib.augmentation import *
 from test_util import check_diff
 
 def test_flip(data):
@@ -28,10 +28,66 @@ def test_grey(data):
     check_diff(data2[k], data[k][:,:,:,1:][:,:,:,::-1])
 
 
+def blur_reference(sample, imgs, mode, max_sec, sigma_max, rng, min_sigma=0.3):
+    # gaussian_filter + quadrant writes, with the same draws as Blur.augment
+    num_sec = rng.integers(1, max_sec + 1)
+    zdim, ydim, xdim = sample[imgs[0]].shape[-3:]
+    zlocs = np.sort(rng.choice(zdim, num_sec, replace=False)).tolist()
+    nkey = len(imgs)
+    if mode == 'full':
+        sigmas = rng.random((num_sec, nkey)) * sigma_max
+        for i, z in enumerate(zlocs):
+            for j, key in enumerate(imgs):
+                if sigmas[i,j] < min_sigma:
+                    continue
+                img = sample[key][...,z,:,:]
+                img[...] = gaussian_filter(img, sigma=round(sigmas[i,j], 1))
+        return sample
+    sigmas = rng.random(num_sec) * sigma_max
+    fulls  = rng.random((num_sec, nkey)) > 0.5
+    xs     = rng.integers(0, xdim, (num_sec, nkey))
+    ys     = rng.integers(0, ydim, (num_sec, nkey))
+    rules  = rng.random((num_sec, nkey, 4)) > 0.5
+    for i, z in enumerate(zlocs):
+        if sigmas[i] < min_sigma:
+            continue
+        for j, key in enumerate(imgs):
+            img = gaussian_filter(sample[key][...,z,:,:], sigma=round(sigmas[i], 1))
+            if mode == 'mix' and fulls[i,j]:
+                sample[key][...,z,:,:] = img
+                continue
+            x, y, rule = xs[i,j], ys[i,j], rules[i,j]
+            if rule[0]:
+                sample[key][...,z,:y,:x] = img[...,:y,:x]
+            if rule[1]:
+                sample[key][...,z,y:,:x] = img[...,y:,:x]
+            if rule[2]:
+                sample[key][...,z,:y,x:] = img[...,:y,x:]
+            if rule[3]:
+                sample[key][...,z,y:,x:] = img[...,y:,x:]
+    return sample
+
+def test_blur():
+    imgs = ['img', 'img2']
+    # sigma_max=15 exercises the FFT path as well.
+    for max_sec, sigma_max in [(1, 5.0), (3, 5.0), (3, 15.0)]:
+        for mode in ['full', 'partial', 'mix']:
+            aug = Blur(max_sec=max_sec, sigma_max=sigma_max, mode=mode, seed=0)
+            rng = np.random.default_rng(0)
+            for i in range(20):
+                rs = np.random.RandomState(i)
+                data = {'img': rs.rand(1,6,37,41), 'img2': rs.rand(6,37,41)}
+                ref = dict((k, v.copy()) for k, v in data.items())
+                blur_reference(ref, imgs, mode, max_sec, sigma_max, rng)
+                aug.augment(data, imgs=imgs)
+                for k in imgs:
+                    assert np.abs(data[k] - ref[k]).max() < 1e-6
+
 def test_warp(img, seg):
     import pdb; pdb.set_trace()
 
 if __name__ == '__main__':
+    import h5py
     # tensorboard --logdir test
     D0='/n/coxfs01/donglai/data/cremi/mala_v2/data_align_crop/'
     img = np.array(h5py.File(D0+'sample_B_im_crop.hdf')['main'])
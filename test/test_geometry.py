@@ -0,0 +1,90 @@
+import copy
+import pickle
+import numpy as np
+
+from em_dataLib.geometry.vector import *
+
+def check_close(a, b):
+    assert np.allclose(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+
+def test_vec3d_operands():
+    v = Vec3d(1,2,3)
+    assert v + Vec3d(1,1,1) == (2,3,4)
+    assert v * 2 == (2,4,6)
+    assert v - [1,2,3] == (0,0,0)
+    assert 12 / Vec3d(1,2,4) == (12,6,3)
+    assert v * np.float64(2) == (2,4,6)
+    assert v + np.int64(1) == (2,3,4)
+    assert v * np.array([1,2,3]) == (1,4,9)
+    w = Vec3d(v)
+    w /= np.float32(2)
+    assert w == (0.5,1,1.5)
+
+class Point(Vec3d):
+    __slots__ = []
+
+def test_vec3d_pickle():
+    v = Vec3d(1, 2.5, -3)
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        w = pickle.loads(pickle.dumps(v, protocol))
+        assert type(w) is Vec3d and w == v
+    w = copy.deepcopy(v)
+    assert w == v and w is not v
+    # Subclasses survive the round-trip.
+    v = Point(1, 2, 3)
+    assert type(pickle.loads(pickle.dumps(v))) is Point
+    assert type(copy.deepcopy(v)) is Point
+
+def test_vec3d_array():
+    a = np.array([[1,0,3], [0,2,0], [3,0,9]], dtype=float)
+    b = np.array([[0,1,0], [1,1,1], [2,0,1]], dtype=float)
+    A = Vec3dArray(a)
+    B = Vec3dArray(b[:,0], b[:,1], b[:,2])
+    check_close(A + B, a + b)
+    check_close(A - B, a - b)
+    check_close(A * B, a * b)
+    check_close(A.dot(B), (a*b).sum(axis=1))
+    check_close(A.cross(B), np.cross(a, b))
+    check_close(A.length, np.linalg.norm(a, axis=1))
+    check_close(A.normalized(), a / np.linalg.norm(a, axis=1)[:,None])
+    check_close(minimum(A, B), np.minimum(a, b))
+    check_close(maximum(B, A), np.maximum(a, b))
+    check_close(A.interpolate_to(B, 0.5), (a + b)/2)
+    # A single vector broadcasts over the batch.
+    check_close(A + Vec3d(1,2,3), a + [1,2,3])
+    check_close(A - (1,2,3), a - [1,2,3])
+    check_close(A.cross([1,0,0]), np.cross(a, [1,0,0]))
+    assert A[2] == Vec3d(3,0,9)
+    check_close(A[1:], a[1:])
+
+def test_vec3d_array_scalars():
+    a = np.array([[1,0,3], [0,2,0], [3,0,9]], dtype=float)
+    A = Vec3dArray(a)
+    # Per-vector arrays of length N broadcast, even when N == 3.
+    length = np.linalg.norm(a, axis=1)
+    check_close(A * A.length, a * length[:,None])
+    check_close(A / A.length, a / length[:,None])
+    check_close(A + length, a + length[:,None])
+    check_close(A.dot(length), a.sum(axis=1) * length)
+    check_close(minimum(A, length), np.minimum(a, length[:,None]))
+    # Numpy scalars are scalars.
+    check_close(A * np.float64(2), a * 2)
+    check_close(A / np.float64(2), a / 2)
+    check_close(A + np.float32(1), a + 1)
+    check_close(2 * A, a * 2)
+
+def test_vec3d_array_dtypes():
+    # Component dtypes numba cannot compile still work.
+    for dtype in [np.float16, object]:
+        a = np.arange(9).reshape(3,3).astype(dtype)
+        A = Vec3dArray(a)
+        check_close(A.dot(A), (a.astype(float)**2).sum(axis=1))
+        check_close(A.cross(A), np.zeros((3,3)))
+        check_close(A + A, 2*a.astype(float))
+
+if __name__ == '__main__':
+    test_vec3d_operands()
+    test_vec3d_pickle()
+    test_vec3d_array()
+    test_vec3d_array_scalars()
+    test_vec3d_array_dtypes()